@@ -1,28 +1,69 @@
 """Configuration loading and validation."""
 
+import functools
 import os
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class Settings(BaseModel):
     """Environment-driven configuration (fail-fast validation)."""
 
+    # Shared via the get_settings() cache, so instances must not be mutated
+    model_config = ConfigDict(frozen=True, protected_namespaces=())
+
     environment: str = Field("development", description="Environment name")
     log_level: str = Field("INFO", description="Logging level")
     max_input_length: int = Field(5000, description="Max input length in chars")
+    model_name: str = Field("gpt-4", description="LLM model name")
+    llm_endpoint: str = Field(
+        "https://api.openai.com/v1/chat/completions", description="LLM chat completions URL"
+    )
+    api_key: str = Field("", description="LLM API key (empty or 'mock' enables mock mode)")
+    timeout_seconds: float = Field(30.0, description="Per-request LLM timeout in seconds")
+    max_retries: int = Field(2, description="Retry attempts after an LLM timeout")
+    prompt_caching: bool = Field(False, description="Send an OpenAI prompt_cache_key")
+    base_backoff: float = Field(1.0, description="Base retry backoff in seconds")
+    max_backoff: float = Field(30.0, description="Retry backoff cap in seconds")
+    batch_poll_seconds: float = Field(30.0, description="Batch job status poll interval")
+    max_concurrency: int = Field(10, description="Max in-flight LLM requests")
+    requests_per_second: float = Field(10.0, description="LLM request rate limit (token bucket)")
 
     def validate_or_raise(self) -> None:
         if self.environment not in {"development", "staging", "production"}:
             raise ValueError("ENVIRONMENT must be development, staging, or production")
         if self.max_input_length < 100:
             raise ValueError("MAX_INPUT_LENGTH must be >= 100")
+        if self.timeout_seconds <= 0:
+            raise ValueError("TIMEOUT_SECONDS must be > 0")
+        if self.max_retries < 0:
+            raise ValueError("MAX_RETRIES must be >= 0")
+        if self.base_backoff < 0 or self.max_backoff < self.base_backoff:
+            raise ValueError("BASE_BACKOFF must be >= 0 and <= MAX_BACKOFF")
+        if self.batch_poll_seconds <= 0:
+            raise ValueError("BATCH_POLL_SECONDS must be > 0")
+        if self.max_concurrency < 1:
+            raise ValueError("MAX_CONCURRENCY must be >= 1")
+        if self.requests_per_second <= 0:
+            raise ValueError("REQUESTS_PER_SECOND must be > 0")
 
 
+@functools.lru_cache(maxsize=1)
 def get_settings() -> Settings:
     settings = Settings(
         environment=os.getenv("ENVIRONMENT", "development"),
         log_level=os.getenv("LOG_LEVEL", "INFO"),
         max_input_length=int(os.getenv("MAX_INPUT_LENGTH", "5000")),
+        model_name=os.getenv("MODEL_NAME", "gpt-4"),
+        llm_endpoint=os.getenv("LLM_ENDPOINT", "https://api.openai.com/v1/chat/completions"),
+        api_key=os.getenv("LLM_API_KEY", ""),
+        timeout_seconds=float(os.getenv("TIMEOUT_SECONDS", "30")),
+        max_retries=int(os.getenv("MAX_RETRIES", "2")),
+        prompt_caching=os.getenv("PROMPT_CACHING", "false").lower() == "true",
+        base_backoff=float(os.getenv("BASE_BACKOFF", "1")),
+        max_backoff=float(os.getenv("MAX_BACKOFF", "30")),
+        batch_poll_seconds=float(os.getenv("BATCH_POLL_SECONDS", "30")),
+        max_concurrency=int(os.getenv("MAX_CONCURRENCY", "10")),
+        requests_per_second=float(os.getenv("REQUESTS_PER_SECOND", "10")),
     )
     settings.validate_or_raise()
     return settings
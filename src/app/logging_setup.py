@@ -1,21 +1,25 @@
 """Structured logging setup with correlation IDs and redaction."""
 
 import logging
-import uuid
+import secrets
+from typing import Final
+
 from pythonjsonlogger import jsonlogger
 
 
 class SafeJSONFormatter(jsonlogger.JsonFormatter):
-    """JSON formatter that avoids logging raw ticket text."""
+    """JSON formatter that avoids logging raw ticket text or LLM payloads."""
+
+    _REDACTED: Final[frozenset[str]] = frozenset({"ticket_text", "prompt", "response"})
 
     def add_fields(self, log_record, record, message_dict):
         super().add_fields(log_record, record, message_dict)
-        if "ticket_text" in log_record:
-            log_record["ticket_text"] = "[REDACTED]"
+        for key in self._REDACTED & log_record.keys():
+            log_record[key] = "[REDACTED]"
 
 
 def create_request_id() -> str:
-    return str(uuid.uuid4())[:8]
+    return secrets.token_hex(4)
 
 
 def setup_logging(log_level: str) -> logging.Logger:
@@ -1,7 +1,6 @@
-"""CLI entrypoint for TicketAI (stubbed)."""
+"""CLI entrypoint for TicketAI."""
 
 import argparse
-import json
 import sys
 from pathlib import Path
 
@@ -10,23 +9,11 @@ SRC_DIR = Path(__file__).resolve().parents[1]
 if str(SRC_DIR) not in sys.path:
     sys.path.append(str(SRC_DIR))
 
-from app.config import get_settings
-from app.logging_setup import setup_logging, create_request_id
 
-
-def load_ticket(file_path: str) -> str:
-    return Path(file_path).read_text(encoding="utf-8")
-
-
-def stub_pipeline(ticket_text: str) -> dict:
-    return {
-        "summary": "Stubbed summary: provide short summary here.",
-        "category": "General",
-        "priority": "Medium",
-        "queue": "Support L1",
-        "confidence": 0.0,
-        "needs_human_review": True,
-    }
+def load_ticket(file_path: str, max_chars: int) -> str:
+    # Read one char past the limit so the caller can tell the file was truncated
+    with open(file_path, "r", encoding="utf-8") as f:
+        return f.read(max_chars + 1)
 
 
 def main() -> None:
@@ -37,28 +24,60 @@ def main() -> None:
     parser.add_argument("--output", choices=["json", "pretty"], default="json")
     args = parser.parse_args()
 
+    # Deferred so --help and argument errors exit before heavy imports load
+    import asyncio
+
+    import orjson
+
+    from app.config import get_settings
+    from app.logging_setup import setup_logging, create_request_id
+    from app.llm_client import LLMClient
+    from app.pipeline import TicketPipeline
+
     settings = get_settings()
     logger = setup_logging(settings.log_level)
     request_id = create_request_id()
 
-    ticket_text = load_ticket(args.file) if args.file else args.text
-    if len(ticket_text) > settings.max_input_length:
-        ticket_text = ticket_text[: settings.max_input_length]
+    ticket_text = (
+        load_ticket(args.file, settings.max_input_length) if args.file else args.text
+    )
+    truncated = len(ticket_text) > settings.max_input_length
+    if truncated:
         logger.warning("ticket_truncated", extra={"request_id": request_id})
+    ticket_text = ticket_text[: settings.max_input_length]
+    input_length = len(ticket_text)
+
+    logger.info("triage_start", extra={"request_id": request_id, "input_length": input_length})
+
+    llm_client = LLMClient(settings, logger)
+    pipeline = TicketPipeline(settings, llm_client, logger)
 
-    logger.info("triage_start", extra={"request_id": request_id, "input_length": len(ticket_text)})
+    async def run():
+        async with llm_client:
+            return await pipeline.process_ticket(
+                ticket_text, request_id, input_length=input_length, truncated=truncated
+            )
 
-    result = stub_pipeline(ticket_text)
+    result, success = asyncio.run(run())
     payload = {
         "request_id": request_id,
-        **result,
-        "metadata": {"input_length": len(ticket_text), "stub": True},
+        "summary": result.summary,
+        "category": result.category,
+        "priority": result.priority,
+        "queue": result.queue,
+        "confidence": result.confidence,
+        "needs_human_review": result.needs_human_review,
+        "metadata": {
+            "input_length": result.input_length,
+            "latency_ms": result.latency_ms,
+            "tokens_estimate": result.tokens_estimate,
+            "success": success,
+            "mock": llm_client.mock_mode,
+        },
     }
 
-    if args.output == "pretty":
-        print(json.dumps(payload, indent=2))
-    else:
-        print(json.dumps(payload))
+    option = orjson.OPT_INDENT_2 if args.output == "pretty" else 0
+    print(orjson.dumps(payload, option=option).decode())
 
 
 if __name__ == "__main__":
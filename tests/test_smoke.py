@@ -0,0 +1,462 @@
+"""
+Smoke tests: config, logging, circuit breaker, rate limiting, batch API, E2E.
+
+Run with: python -m tests.test_smoke
+"""
+
+import asyncio
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+import orjson
+
+# Ensure "src" is on sys.path when running from the repo root
+SRC_DIR = Path(__file__).resolve().parents[1] / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+import app.llm_client as llm_client_module
+from app.config import Settings, get_settings
+from app.llm_client import CircuitBreaker, LLMClient
+from app.logging_setup import SafeJSONFormatter, create_request_id, setup_logging
+from app.main import load_ticket
+from app.pipeline import TicketPipeline
+
+ENDPOINT = "https://llm.test/v1/chat/completions"
+TRIAGE_JSON = orjson.dumps({
+    "summary": "Customer cannot log in.",
+    "category": "Access",
+    "priority": "High",
+    "queue": "Support L2",
+    "confidence": 0.9,
+    "needs_human_review": False,
+}).decode()
+
+logger = logging.getLogger("ticketai.tests")
+
+
+def _settings(**overrides) -> Settings:
+    values = {"api_key": "test", "llm_endpoint": ENDPOINT, "max_retries": 0}
+    values.update(overrides)
+    return Settings(**values)
+
+
+def _chat_response(content: str) -> httpx.Response:
+    return httpx.Response(200, json={"choices": [{"message": {"content": content}}]})
+
+
+def _age_breaker(breaker: CircuitBreaker, seconds: float) -> None:
+    """Pretend the last failure happened `seconds` ago (no wall-clock sleeps)."""
+    breaker.last_failure_time -= seconds
+
+
+def test_config_loading():
+    print("✓ Testing config loading...")
+    settings = get_settings()
+    assert settings.max_input_length >= 100
+    assert settings.max_concurrency >= 1
+    print("  ✓ Config loaded successfully")
+
+
+def test_logging_setup():
+    print("✓ Testing logging setup...")
+    setup_logging("INFO")
+    request_id = create_request_id()
+    assert len(request_id) == 8
+    print(f"  ✓ Logger initialized, request_id: {request_id}")
+
+
+def test_load_ticket_truncation():
+    print("✓ Testing bounded ticket file reads...")
+    with tempfile.TemporaryDirectory() as tmp:
+        big = Path(tmp) / "big.txt"
+        big.write_text("é" * 20000, encoding="utf-8")
+        small = Path(tmp) / "small.txt"
+        small.write_text("short ticket", encoding="utf-8")
+
+        # One char past the limit signals truncation without reading the whole file
+        text = load_ticket(str(big), 100)
+        assert len(text) == 101 and len(text) > 100
+        assert load_ticket(str(small), 100) == "short ticket"
+    print("  ✓ load_ticket reads at most max_chars + 1")
+
+
+def test_log_redaction():
+    print("✓ Testing log redaction...")
+    formatter = SafeJSONFormatter()
+    record = logging.LogRecord("ticketai", logging.INFO, __file__, 1, "msg", None, None)
+    record.ticket_text = "my password is hunter2"
+    record.prompt = "full prompt"
+    record.response = "raw llm output"
+    record.request_id = "abcd1234"
+    output = orjson.loads(formatter.format(record))
+    assert output["ticket_text"] == output["prompt"] == output["response"] == "[REDACTED]"
+    assert output["request_id"] == "abcd1234"
+    print("  ✓ ticket_text/prompt/response redacted, metadata kept")
+
+
+def test_prompt_cache_key():
+    print("✓ Testing prompt_cache_key opt-in...")
+    default_body = LLMClient(_settings(), logger)._chat_body("ticket", "system")
+    assert "prompt_cache_key" not in default_body, "must be off by default"
+
+    client = LLMClient(_settings(prompt_caching=True), logger)
+    first = client._chat_body("ticket one", "system")
+    second = client._chat_body("ticket two", "system")
+    assert first["prompt_cache_key"] == second["prompt_cache_key"]
+    assert first["prompt_cache_key"] != client._chat_body("t", "other")["prompt_cache_key"]
+    assert first["messages"][0] == {"role": "system", "content": "system"}
+    print("  ✓ Key sent only when enabled, stable per system prompt")
+
+
+def test_circuit_breaker_trip_probe_reopen():
+    print("✓ Testing circuit breaker trip/probe/reopen...")
+    breaker = CircuitBreaker(failure_threshold=2, timeout_seconds=60)
+    breaker.record_failure()
+    assert breaker.call() == (False, None)
+    breaker.record_failure()
+    assert breaker.call()[0], "breaker should be open after threshold"
+
+    # First window is 0.5s; then exactly one probe gets through
+    _age_breaker(breaker, 0.6)
+    is_open, probe = breaker.call()
+    assert not is_open and probe is not None, "probe should be allowed"
+    assert breaker.call()[0], "only one probe at a time"
+
+    # Failed probe reopens with a longer (1s) window
+    breaker.record_failure(probe)
+    assert breaker.call()[0]
+    _age_breaker(breaker, 0.6)
+    assert breaker.call()[0], "second window should be longer"
+    _age_breaker(breaker, 0.6)
+    is_open, probe = breaker.call()
+    assert not is_open
+
+    breaker.record_success(probe)
+    assert breaker.call() == (False, None)
+    assert not breaker.is_open
+    print("  ✓ Breaker trips, probes and reopens")
+
+
+def test_circuit_breaker_only_probe_reports():
+    print("✓ Testing half-open outcome ownership...")
+    breaker = CircuitBreaker(failure_threshold=1, timeout_seconds=60, probe_timeout_seconds=90)
+    breaker.record_failure()
+    _age_breaker(breaker, 0.6)
+    _, probe = breaker.call()
+
+    # A call that was in flight before the trip must not decide the probe
+    breaker.record_failure()
+    breaker.record_success()
+    assert breaker.is_open and breaker.call()[0], "stragglers are ignored"
+
+    # The backstop is the probe timeout, not the open window
+    breaker._probe_since -= 61
+    assert breaker.call()[0], "probe still within its worst-case duration"
+    breaker._probe_since -= 30
+    is_open, new_probe = breaker.call()
+    assert not is_open and new_probe != probe, "stuck probe is replaced"
+
+    # The superseded probe's outcome no longer counts
+    breaker.record_success(probe)
+    assert breaker.is_open
+    breaker.record_success(new_probe)
+    assert not breaker.is_open
+    print("  ✓ Only the current probe closes or reopens the circuit")
+
+
+def test_llm_client_probe_timeout():
+    print("✓ Testing probe backstop sizing...")
+    settings = _settings(max_retries=2, timeout_seconds=30.0, max_backoff=30.0)
+    client = LLMClient(settings, logger)
+    # 3 attempts x 30s plus backoff must fit inside the backstop
+    assert client.circuit_breaker.probe_timeout_seconds >= 3 * 30 + 2 * 30
+    print("  ✓ Backstop covers the worst-case probe duration")
+
+
+def test_circuit_breaker_cancelled_probe():
+    print("✓ Testing cancelled half-open probe...")
+
+    async def hang(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(30)
+        return _chat_response(TRIAGE_JSON)
+
+    async def run():
+        async with LLMClient(_settings(), logger, transport=httpx.MockTransport(hang)) as client:
+            breaker = client.circuit_breaker
+            for _ in range(breaker.failure_threshold):
+                breaker.record_failure()
+            assert breaker.call()[0]
+
+            _age_breaker(breaker, 0.6)
+            probe = asyncio.create_task(client.call_llm("ticket", "system", "probe"))
+            await asyncio.sleep(0.05)
+            assert breaker.call()[0], "others are blocked while the probe is in flight"
+
+            probe.cancel()
+            try:
+                await probe
+            except asyncio.CancelledError:
+                pass
+            assert not breaker.call()[0], "a new probe should be allowed after cancellation"
+
+    asyncio.run(run())
+    print("  ✓ Cancelled probe does not lock the breaker")
+
+
+def test_token_bucket_pacing():
+    print("✓ Testing token-bucket pacing...")
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return _chat_response(TRIAGE_JSON)
+
+    async def run() -> float:
+        settings = _settings(requests_per_second=5.0, max_concurrency=20)
+        async with LLMClient(settings, logger, transport=httpx.MockTransport(handler)) as client:
+            start = time.monotonic()
+            results = await asyncio.gather(
+                *[client.call_llm("ticket", "system", f"r{i}") for i in range(15)]
+            )
+            elapsed = time.monotonic() - start
+        assert all(r["success"] for r in results)
+        return elapsed
+
+    # 5 burst tokens, then 10 more at 5 rps: never faster than 2s; generous
+    # upper bound so a loaded CI runner doesn't flake
+    elapsed = asyncio.run(run())
+    assert 1.9 <= elapsed <= 10.0, f"expected ~2s, took {elapsed:.2f}s"
+    print(f"  ✓ 15 calls at 5 rps took {elapsed:.2f}s")
+
+
+def _batch_handler(output_lines, poll_failures=0):
+    """MockTransport handler for the files/batches endpoints."""
+    state = {"polls": 0, "cancelled": False}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if path == "/v1/files":
+            return httpx.Response(200, json={"id": "file-in"})
+        if path == "/v1/batches":
+            return httpx.Response(200, json={"id": "batch-1", "status": "validating"})
+        if path == "/v1/batches/batch-1/cancel":
+            state["cancelled"] = True
+            return httpx.Response(200, json={"id": "batch-1", "status": "cancelling"})
+        if path == "/v1/batches/batch-1":
+            state["polls"] += 1
+            if state["polls"] <= poll_failures:
+                return httpx.Response(500)
+            return httpx.Response(
+                200, json={"id": "batch-1", "status": "completed", "output_file_id": "file-out"}
+            )
+        if path == "/v1/files/file-out/content":
+            content = b"\n".join(orjson.dumps(line) for line in output_lines)
+            return httpx.Response(200, content=content)
+        return httpx.Response(404)
+
+    return handler, state
+
+
+def _batch_line(custom_id: str, content: str) -> dict:
+    return {
+        "custom_id": custom_id,
+        "response": {"body": {"choices": [{"message": {"content": content}}]}},
+    }
+
+
+def test_retry_jitter_bounds():
+    print("✓ Testing retry jitter bounds...")
+    bounds = []
+
+    class RecordingRng:
+        def uniform(self, low, high):
+            bounds.append((low, high))
+            return 0.0
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        raise httpx.ReadTimeout("timed out", request=request)
+
+    async def run():
+        settings = _settings(max_retries=4, base_backoff=1.0, max_backoff=5.0)
+        async with LLMClient(settings, logger, transport=httpx.MockTransport(handler)) as client:
+            return await client.call_llm("ticket", "system", "r0")
+
+    original = llm_client_module._rng
+    llm_client_module._rng = RecordingRng()
+    try:
+        result = asyncio.run(run())
+    finally:
+        llm_client_module._rng = original
+
+    assert not result["success"] and "timeout" in result["error"]
+    # Full jitter: uniform(0, min(max_backoff, base_backoff * 2**attempt))
+    assert bounds == [(0, 1.0), (0, 2.0), (0, 4.0), (0, 5.0)]
+    print("  ✓ Backoff drawn from [0, min(cap, base·2^n)]")
+
+
+def test_call_llm_batch_order():
+    print("✓ Testing batch result ordering...")
+    # Provider output is unordered and item 1 is missing
+    handler, state = _batch_handler(
+        [_batch_line("2", "third"), _batch_line("0", "first"), _batch_line("3", "fourth")],
+        poll_failures=1,
+    )
+
+    async def run():
+        settings = _settings(batch_poll_seconds=0.01, max_retries=2)
+        async with LLMClient(settings, logger, transport=httpx.MockTransport(handler)) as client:
+            return await client.call_llm_batch(
+                [(f"prompt {i}", "system", f"r{i}") for i in range(4)]
+            )
+
+    results = asyncio.run(run())
+    assert [r["response"] for r in results] == ["first", None, "third", "fourth"]
+    assert [r["success"] for r in results] == [True, False, True, True]
+    assert not state["cancelled"], "a transient poll error should be tolerated"
+    print("  ✓ Batch results mapped back by input order")
+
+
+def test_call_llm_batch_job_failure():
+    print("✓ Testing batch job failure accounting...")
+    handler, state = _batch_handler([], poll_failures=10)
+
+    async def run():
+        settings = _settings(batch_poll_seconds=0.01, max_retries=1)
+        async with LLMClient(settings, logger, transport=httpx.MockTransport(handler)) as client:
+            results = await client.call_llm_batch(
+                [(f"prompt {i}", "system", f"r{i}") for i in range(6)]
+            )
+            return results, client.circuit_breaker
+
+    results, breaker = asyncio.run(run())
+    assert not any(r["success"] for r in results)
+    assert breaker.failure_count == 1 and not breaker.is_open
+    assert state["cancelled"], "abandoned job should be cancelled"
+    print("  ✓ One job failure recorded, job cancelled")
+
+
+def test_call_llm_batch_breaker_outcome_per_job():
+    print("✓ Testing batch breaker accounting per job...")
+    # Many missing items in a row must not trip the breaker if others came back
+    handler, _ = _batch_handler([_batch_line("9", "last")])
+
+    async def run():
+        settings = _settings(batch_poll_seconds=0.01)
+        async with LLMClient(settings, logger, transport=httpx.MockTransport(handler)) as client:
+            results = await client.call_llm_batch(
+                [(f"prompt {i}", "system", f"r{i}") for i in range(10)]
+            )
+            return results, client.circuit_breaker
+
+    results, breaker = asyncio.run(run())
+    assert [r["success"] for r in results] == [False] * 9 + [True]
+    assert breaker.failure_count == 0 and not breaker.is_open
+
+    # A job where nothing came back is a single failure
+    handler, _ = _batch_handler([])
+    results, breaker = asyncio.run(run())
+    assert breaker.failure_count == 1
+    print("  ✓ One breaker outcome per batch job")
+
+
+def test_call_llm_batch_rejects_non_openai_endpoint():
+    print("✓ Testing batch endpoint validation...")
+    azure = "https://res.openai.azure.com/openai/deployments/gpt4/chat/completions?api-version=1"
+
+    async def run(endpoint: str):
+        async with LLMClient(_settings(llm_endpoint=endpoint), logger) as client:
+            if endpoint == ENDPOINT:
+                return client._batch_api_base()
+            try:
+                await client.call_llm_batch([("prompt", "system", "r0")])
+            except ValueError as e:
+                assert client.circuit_breaker.failure_count == 0
+                return str(e)
+            raise AssertionError("expected ValueError")
+
+    assert asyncio.run(run(ENDPOINT)) == "https://llm.test/v1"
+    assert "/v1/chat/completions" in asyncio.run(run(azure))
+    print("  ✓ Non-OpenAI endpoints rejected with a clear error")
+
+
+def test_process_tickets_batch():
+    print("✓ Testing pipeline batch triage...")
+    # Item 0 valid, item 1 empty (never submitted), item 2 oversized, item 3 malformed
+    handler, _ = _batch_handler([
+        _batch_line("0", TRIAGE_JSON),
+        _batch_line("1", TRIAGE_JSON),
+        _batch_line("2", "[1, 2]"),
+    ])
+    tickets = [("I cannot log in", "r0"), ("\u200b\x01", "r1"), ("x" * 9000, "r2"),
+               ("ticket", "r3")]
+
+    async def run():
+        settings = _settings(batch_poll_seconds=0.01)
+        async with LLMClient(settings, logger, transport=httpx.MockTransport(handler)) as client:
+            pipeline = TicketPipeline(settings, client, logger)
+            return await pipeline.process_tickets_batch(tickets)
+
+    results = asyncio.run(run())
+    assert [r.request_id for r, _ in results] == ["r0", "r1", "r2", "r3"]
+    assert [ok for _, ok in results] == [True, False, True, False]
+    assert "Empty ticket" in results[1][0].summary
+    assert results[2][0].input_length == 5000
+    assert "Parse error" in results[3][0].summary
+    print("  ✓ Batch triage keeps order and falls back per ticket")
+
+
+def test_pipeline_e2e():
+    print("✓ Testing pipeline end-to-end...")
+    responses = iter([TRIAGE_JSON, "[1, 2]", '{"summary": "s", "category": null}'])
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return _chat_response(next(responses))
+
+    async def run():
+        settings = _settings()
+        async with LLMClient(settings, logger, transport=httpx.MockTransport(handler)) as client:
+            pipeline = TicketPipeline(settings, client, logger)
+            single = await pipeline.process_ticket("I cannot log in", "r0")
+            malformed = await pipeline.process_batch([("ticket", "r1"), ("ticket", "r2")])
+            return single, malformed
+
+    (output, success), malformed = asyncio.run(run())
+    assert success and output.category == "Access" and output.queue == "Support L2"
+    assert [ok for _, ok in malformed] == [False, False]
+    print("  ✓ Valid and malformed LLM output handled")
+
+
+def test_pipeline_rejects_control_only_ticket():
+    print("✓ Testing control/zero-width-only tickets...")
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        raise AssertionError("empty ticket must not reach the LLM")
+
+    async def run():
+        settings = _settings()
+        async with LLMClient(settings, logger, transport=httpx.MockTransport(handler)) as client:
+            pipeline = TicketPipeline(settings, client, logger)
+            return await pipeline.process_ticket("​\x01\x02", "r0")
+
+    output, success = asyncio.run(run())
+    assert not success and "Empty ticket" in output.summary
+    print("  ✓ Sanitized-empty ticket rejected before the LLM call")
+
+
+def main() -> None:
+    print("=" * 62)
+    print("  TICKET TRIAGE SERVICE - SMOKE TESTS")
+    print("=" * 62)
+    print()
+    tests = [obj for name, obj in globals().items() if name.startswith("test_")]
+    for test in tests:
+        test()
+    print()
+    print("✓ ALL TESTS PASSED")
+
+
+if __name__ == "__main__":
+    main()